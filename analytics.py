@@ -1,174 +1,330 @@
 import os
-import psycopg2
-import pandas as pd
-import matplotlib.pyplot as plt
-import plotly.express as px
-from openpyxl import load_workbook
-from openpyxl.formatting.rule import ColorScaleRule
+import json
+import hashlib
+import argparse
+import tempfile
+from datetime import date
 from dotenv import load_dotenv
+from db import read_query
 
 load_dotenv()
-os.makedirs("charts", exist_ok=True)
-os.makedirs("exports", exist_ok=True)
 
-plt.style.use('seaborn-v0_8')
 COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7', '#DDA0DD']
+MANIFEST_PATH = "charts/.render_manifest.json"
 
-def run_query(query):
-    conn = psycopg2.connect(
-        dbname=os.getenv("DB_NAME"), user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"), host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT")
-    )
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
-
-def create_pie_chart():
-    query = """
-    SELECT c.customer_state, COUNT(*) AS total_orders
-    FROM olist_orders o
-    JOIN olist_customers c ON o.customer_id = c.customer_id
-    JOIN olist_order_payments p ON o.order_id = p.order_id
-    GROUP BY c.customer_state
-    ORDER BY total_orders DESC
-    LIMIT 8;
+_plt = None
+
+def get_pyplot():
+    """Import matplotlib on first use so only chart commands pay for it"""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        plt.style.use('seaborn-v0_8')
+        os.makedirs("charts", exist_ok=True)
+        _plt = plt
+    return _plt
+
+def load_manifest():
+    """Read the chart path -> fingerprint map written by previous runs"""
+    try:
+        with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def atomic_write(path, write):
+    """Call write(tmp_path) and move the result over path in one rename"""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    try:
+        write(tmp_path)
+        # mkstemp creates the file as 0600; give it the mode a plain open() would have.
+        # The umask can only be read by setting it, so put it straight back.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def save_manifest(manifest):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    atomic_write(MANIFEST_PATH, write)
+
+def chart_fingerprint(df, params):
+    """Hash a chart's result set together with the parameters it is drawn with"""
+    import pandas as pd
+    digest = hashlib.sha256()
+    digest.update(json.dumps([list(map(str, df.columns)), [str(t) for t in df.dtypes]]).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+def chart_is_current(path, digest, force=False):
+    return not force and os.path.exists(path) and load_manifest().get(path) == digest
+
+def save_chart(plt, path, digest):
+    """Write the current figure atomically and record its fingerprint"""
+    try:
+        atomic_write(path, lambda tmp_path: plt.savefig(tmp_path, format='png'))
+    finally:
+        plt.close()
+    manifest = load_manifest()
+    manifest[path] = digest
+    save_manifest(manifest)
+
+def run_query(query, params=None):
+    return read_query(query, params)
+
+def purchase_window(start=None, end=None):
+    """Filter on o.order_purchase_timestamp so Postgres can prune monthly partitions
+
+    start is inclusive and end exclusive; either may be None for an open range.
     """
-    df = run_query(query)
-    plt.figure(figsize=(10, 8))
-    plt.pie(df['total_orders'], labels=df['customer_state'], autopct='%1.1f%%', colors=COLORS)
-    plt.title('Distribution of Orders by Customer State')
-    plt.savefig('charts/pie_orders_by_state.png')
-    plt.close()
+    clauses, params = [], {}
+    if start:
+        clauses.append("AND o.order_purchase_timestamp >= %(start)s")
+        params["start"] = start
+    if end:
+        clauses.append("AND o.order_purchase_timestamp < %(end)s")
+        params["end"] = end
+    return "\n        ".join(clauses), params
+
+# Result sets behind the charts and Excel sheets, also served by api.py.
+# {window} marks where purchase_window() adds its date filter.
+DATASETS = {
+    "orders_by_state": """
+        SELECT c.customer_state, COUNT(*) AS total_orders
+        FROM olist_orders o
+        JOIN olist_customers c ON o.customer_id = c.customer_id
+        JOIN olist_order_payments p ON o.order_id = p.order_id
+        GROUP BY c.customer_state
+        ORDER BY total_orders DESC
+        LIMIT 8;
+    """,
+    "orders_by_payment_type": """
+        SELECT p.payment_type, COUNT(*) as total_orders, ROUND(AVG(p.payment_value), 2) as avg_payment
+        FROM olist_orders o
+        JOIN olist_customers c ON o.customer_id = c.customer_id
+        JOIN olist_order_payments p ON o.order_id = p.order_id
+        GROUP BY p.payment_type
+        ORDER BY total_orders DESC;
+    """,
+    "customers_by_state": """
+        SELECT c.customer_state, COUNT(DISTINCT c.customer_id) as total_customers
+        FROM olist_customers c
+        JOIN olist_orders o ON c.customer_id = o.customer_id
+        JOIN olist_order_payments p ON o.order_id = p.order_id
+        GROUP BY c.customer_state
+        ORDER BY total_customers DESC
+        LIMIT 10;
+    """,
+    "monthly_trends": """
+        SELECT DATE_TRUNC('month', o.order_purchase_timestamp) as month,
+               COUNT(DISTINCT o.order_id) as monthly_orders,
+               ROUND(AVG(p.payment_value), 2) as avg_payment
+        FROM olist_orders o
+        JOIN olist_customers c ON o.customer_id = c.customer_id
+        JOIN olist_order_payments p ON o.order_id = p.order_id
+        WHERE o.order_purchase_timestamp IS NOT NULL
+        {window}
+        GROUP BY month
+        ORDER BY month;
+    """,
+    "product_prices": """
+        SELECT oi.price
+        FROM olist_order_items oi
+        JOIN olist_orders o ON oi.order_id = o.order_id
+        JOIN olist_products p ON oi.product_id = p.product_id
+        WHERE oi.price < 500 AND oi.price > 0;
+    """,
+    "price_vs_freight": """
+        SELECT oi.price, oi.freight_value, p.payment_value
+        FROM olist_order_items oi
+        JOIN olist_orders o ON oi.order_id = o.order_id
+        JOIN olist_order_payments p ON o.order_id = p.order_id
+        WHERE oi.price < 200 AND oi.freight_value < 50
+        AND oi.price > 0 AND oi.freight_value > 0
+        LIMIT 1000;
+    """,
+    "monthly_orders_by_state": """
+        SELECT DATE_TRUNC('month', o.order_purchase_timestamp) as month,
+               c.customer_state, COUNT(*) as order_count,
+               ROUND(AVG(p.payment_value), 2) as avg_payment
+        FROM olist_orders o
+        JOIN olist_customers c ON o.customer_id = c.customer_id
+        JOIN olist_order_payments p ON o.order_id = p.order_id
+        WHERE o.order_purchase_timestamp IS NOT NULL
+        AND c.customer_state IS NOT NULL
+        {window}
+        GROUP BY month, c.customer_state
+        HAVING COUNT(*) > 1
+        ORDER BY month;
+    """,
+    "state_order_summary": """
+        SELECT c.customer_state, COUNT(*) as total_orders,
+               ROUND(AVG(p.payment_value), 2) as avg_payment
+        FROM olist_orders o
+        JOIN olist_customers c ON o.customer_id = c.customer_id
+        JOIN olist_order_payments p ON o.order_id = p.order_id
+        GROUP BY c.customer_state
+        ORDER BY total_orders DESC;
+    """,
+    "payment_analysis": """
+        SELECT p.payment_type, COUNT(*) as transaction_count,
+               ROUND(AVG(p.payment_value), 2) as avg_payment,
+               MIN(p.payment_value) as min_payment,
+               MAX(p.payment_value) as max_payment
+        FROM olist_order_payments p
+        JOIN olist_orders o ON p.order_id = o.order_id
+        JOIN olist_customers c ON o.customer_id = c.customer_id
+        GROUP BY p.payment_type
+        ORDER BY transaction_count DESC;
+    """,
+}
+
+EXCEL_SHEETS = {"Order_Summary": "state_order_summary", "Payment_Analysis": "payment_analysis"}
+
+def dataset_query(name, start=None, end=None):
+    """Return the SQL and params for a dataset, restricted to a purchase date window if given"""
+    window, params = purchase_window(start, end)
+    return DATASETS[name].replace("{window}", window), params
+
+def create_pie_chart(force=False):
+    df = run_query(DATASETS["orders_by_state"])
+    path = 'charts/pie_orders_by_state.png'
+    params = {'figsize': (10, 8), 'colors': COLORS, 'autopct': '%1.1f%%',
+              'title': 'Distribution of Orders by Customer State'}
+    digest = chart_fingerprint(df, params)
+    if chart_is_current(path, digest, force):
+        print("Pie Chart: unchanged, skipped")
+        return
+    plt = get_pyplot()
+    plt.figure(figsize=params['figsize'])
+    plt.pie(df['total_orders'], labels=df['customer_state'], autopct=params['autopct'], colors=params['colors'])
+    plt.title(params['title'])
+    save_chart(plt, path, digest)
     print(f"Pie Chart: {len(df)} rows")
 
-def create_bar_chart():
-    query = """
-    SELECT p.payment_type, COUNT(*) as total_orders, ROUND(AVG(p.payment_value), 2) as avg_payment
-    FROM olist_orders o
-    JOIN olist_customers c ON o.customer_id = c.customer_id
-    JOIN olist_order_payments p ON o.order_id = p.order_id
-    GROUP BY p.payment_type
-    ORDER BY total_orders DESC;
-    """
-    df = run_query(query)
-    plt.figure(figsize=(12, 6))
-    plt.bar(df['payment_type'], df['total_orders'], color=COLORS[0])
-    plt.title('Total Orders by Payment Type')
-    plt.xlabel('Payment Type')
-    plt.ylabel('Number of Orders')
-    plt.savefig('charts/bar_orders_by_payment.png')
-    plt.close()
+def create_bar_chart(force=False):
+    df = run_query(DATASETS["orders_by_payment_type"])
+    path = 'charts/bar_orders_by_payment.png'
+    params = {'figsize': (12, 6), 'color': COLORS[0], 'title': 'Total Orders by Payment Type',
+              'xlabel': 'Payment Type', 'ylabel': 'Number of Orders'}
+    digest = chart_fingerprint(df, params)
+    if chart_is_current(path, digest, force):
+        print("Bar Chart: unchanged, skipped")
+        return
+    plt = get_pyplot()
+    plt.figure(figsize=params['figsize'])
+    plt.bar(df['payment_type'], df['total_orders'], color=params['color'])
+    plt.title(params['title'])
+    plt.xlabel(params['xlabel'])
+    plt.ylabel(params['ylabel'])
+    save_chart(plt, path, digest)
     print(f"Bar Chart: {len(df)} rows")
 
-def create_horizontal_bar_chart():
-    query = """
-    SELECT c.customer_state, COUNT(DISTINCT c.customer_id) as total_customers
-    FROM olist_customers c
-    JOIN olist_orders o ON c.customer_id = o.customer_id
-    JOIN olist_order_payments p ON o.order_id = p.order_id
-    GROUP BY c.customer_state
-    ORDER BY total_customers DESC
-    LIMIT 10;
-    """
-    df = run_query(query)
-    plt.figure(figsize=(12, 6))
-    plt.barh(df['customer_state'], df['total_customers'], color=COLORS[1])
-    plt.title('Top 10 States by Number of Customers')
-    plt.xlabel('Number of Customers')
-    plt.savefig('charts/barh_customers_by_state.png')
-    plt.close()
+def create_horizontal_bar_chart(force=False):
+    df = run_query(DATASETS["customers_by_state"])
+    path = 'charts/barh_customers_by_state.png'
+    params = {'figsize': (12, 6), 'color': COLORS[1], 'title': 'Top 10 States by Number of Customers',
+              'xlabel': 'Number of Customers'}
+    digest = chart_fingerprint(df, params)
+    if chart_is_current(path, digest, force):
+        print("Horizontal Bar Chart: unchanged, skipped")
+        return
+    plt = get_pyplot()
+    plt.figure(figsize=params['figsize'])
+    plt.barh(df['customer_state'], df['total_customers'], color=params['color'])
+    plt.title(params['title'])
+    plt.xlabel(params['xlabel'])
+    save_chart(plt, path, digest)
     print(f"Horizontal Bar Chart: {len(df)} rows")
 
-def create_line_chart():
-    query = """
-    SELECT DATE_TRUNC('month', o.order_purchase_timestamp) as month,
-           COUNT(DISTINCT o.order_id) as monthly_orders,
-           ROUND(AVG(p.payment_value), 2) as avg_payment
-    FROM olist_orders o
-    JOIN olist_customers c ON o.customer_id = c.customer_id
-    JOIN olist_order_payments p ON o.order_id = p.order_id
-    WHERE o.order_purchase_timestamp IS NOT NULL
-    GROUP BY month
-    ORDER BY month;
-    """
-    df = run_query(query)
+def create_line_chart(force=False, start=None, end=None):
+    query, window_params = dataset_query("monthly_trends", start, end)
+    df = run_query(query, window_params)
+    path = 'charts/line_monthly_trends.png'
+    params = {'figsize': (14, 6), 'color': COLORS[2], 'marker': 'o', 'title': 'Monthly Order Trends',
+              'xlabel': 'Month', 'ylabel': 'Number of Orders', 'xticks_rotation': 45}
+    params.update(window_params)
+    digest = chart_fingerprint(df, params)
+    if chart_is_current(path, digest, force):
+        print("Line Chart: unchanged, skipped")
+        return
+    plt = get_pyplot()
+    import pandas as pd
     df['month'] = pd.to_datetime(df['month'])
-    plt.figure(figsize=(14, 6))
-    plt.plot(df['month'], df['monthly_orders'], marker='o', color=COLORS[2])
-    plt.title('Monthly Order Trends')
-    plt.xlabel('Month')
-    plt.ylabel('Number of Orders')
-    plt.xticks(rotation=45)
-    plt.savefig('charts/line_monthly_trends.png')
-    plt.close()
+    plt.figure(figsize=params['figsize'])
+    plt.plot(df['month'], df['monthly_orders'], marker=params['marker'], color=params['color'])
+    plt.title(params['title'])
+    plt.xlabel(params['xlabel'])
+    plt.ylabel(params['ylabel'])
+    plt.xticks(rotation=params['xticks_rotation'])
+    save_chart(plt, path, digest)
     print(f"Line Chart: {len(df)} rows")
 
-def create_histogram():
-    query = """
-    SELECT oi.price
-    FROM olist_order_items oi
-    JOIN olist_orders o ON oi.order_id = o.order_id
-    JOIN olist_products p ON oi.product_id = p.product_id
-    WHERE oi.price < 500 AND oi.price > 0;
-    """
-    df = run_query(query)
-    plt.figure(figsize=(12, 6))
-    plt.hist(df['price'], bins=30, color=COLORS[3], alpha=0.7)
-    plt.title('Distribution of Product Prices')
-    plt.xlabel('Product Price (R$)')
-    plt.ylabel('Frequency')
-    plt.savefig('charts/hist_product_prices.png')
-    plt.close()
+def create_histogram(force=False):
+    df = run_query(DATASETS["product_prices"])
+    path = 'charts/hist_product_prices.png'
+    params = {'figsize': (12, 6), 'bins': 30, 'color': COLORS[3], 'alpha': 0.7,
+              'title': 'Distribution of Product Prices', 'xlabel': 'Product Price (R$)', 'ylabel': 'Frequency'}
+    digest = chart_fingerprint(df, params)
+    if chart_is_current(path, digest, force):
+        print("Histogram: unchanged, skipped")
+        return
+    plt = get_pyplot()
+    plt.figure(figsize=params['figsize'])
+    plt.hist(df['price'], bins=params['bins'], color=params['color'], alpha=params['alpha'])
+    plt.title(params['title'])
+    plt.xlabel(params['xlabel'])
+    plt.ylabel(params['ylabel'])
+    save_chart(plt, path, digest)
     print(f"Histogram: {len(df)} rows")
 
-def create_scatter_plot():
-    query = """
-    SELECT oi.price, oi.freight_value, p.payment_value
-    FROM olist_order_items oi
-    JOIN olist_orders o ON oi.order_id = o.order_id
-    JOIN olist_order_payments p ON o.order_id = p.order_id
-    WHERE oi.price < 200 AND oi.freight_value < 50
-    AND oi.price > 0 AND oi.freight_value > 0
-    LIMIT 1000;
-    """
-    df = run_query(query)
-    plt.figure(figsize=(10, 6))
-    plt.scatter(df['price'], df['freight_value'], alpha=0.6, color=COLORS[4])
-    plt.title('Price vs Freight Value')
-    plt.xlabel('Product Price (R$)')
-    plt.ylabel('Freight Value (R$)')
-    plt.savefig('charts/scatter_price_vs_freight.png')
-    plt.close()
+def create_scatter_plot(force=False):
+    df = run_query(DATASETS["price_vs_freight"])
+    path = 'charts/scatter_price_vs_freight.png'
+    params = {'figsize': (10, 6), 'color': COLORS[4], 'alpha': 0.6, 'title': 'Price vs Freight Value',
+              'xlabel': 'Product Price (R$)', 'ylabel': 'Freight Value (R$)'}
+    digest = chart_fingerprint(df, params)
+    if chart_is_current(path, digest, force):
+        print("Scatter Plot: unchanged, skipped")
+        return
+    plt = get_pyplot()
+    plt.figure(figsize=params['figsize'])
+    plt.scatter(df['price'], df['freight_value'], alpha=params['alpha'], color=params['color'])
+    plt.title(params['title'])
+    plt.xlabel(params['xlabel'])
+    plt.ylabel(params['ylabel'])
+    save_chart(plt, path, digest)
     print(f"Scatter Plot: {len(df)} rows")
 
-def create_all_visualizations():
-    create_pie_chart()
-    create_bar_chart()
-    create_horizontal_bar_chart()
-    create_line_chart()
-    create_histogram()
-    create_scatter_plot()
-
-def create_time_slider_chart():
-    query = """
-    SELECT DATE_TRUNC('month', o.order_purchase_timestamp) as month,
-           c.customer_state, COUNT(*) as order_count,
-           ROUND(AVG(p.payment_value), 2) as avg_payment
-    FROM olist_orders o
-    JOIN olist_customers c ON o.customer_id = c.customer_id
-    JOIN olist_order_payments p ON o.order_id = p.order_id
-    WHERE o.order_purchase_timestamp IS NOT NULL
-    AND c.customer_state IS NOT NULL
-    GROUP BY month, c.customer_state
-    HAVING COUNT(*) > 1
-    ORDER BY month;
-    """
-    df = run_query(query)
+def create_all_visualizations(force=False, start=None, end=None):
+    create_pie_chart(force)
+    create_bar_chart(force)
+    create_horizontal_bar_chart(force)
+    create_line_chart(force, start, end)
+    create_histogram(force)
+    create_scatter_plot(force)
+
+def create_time_slider_chart(start=None, end=None):
+    query, window_params = dataset_query("monthly_orders_by_state", start, end)
+    df = run_query(query, window_params)
     
     if df.empty:
         print("No data for time slider")
         return
         
+    import pandas as pd
+    import plotly.express as px
     df['month'] = pd.to_datetime(df['month']).dt.strftime('%Y-%m')
     
     print(f"Time Slider Data: {len(df)} rows, {df['month'].nunique()} unique months")
@@ -180,34 +336,15 @@ def create_time_slider_chart():
                     labels={"customer_state": "State", "order_count": "Orders", "avg_payment": "Avg Payment"})
     fig.show()
     
-def export_to_excel():
-    queries = {
-        "Order_Summary": """
-            SELECT c.customer_state, COUNT(*) as total_orders,
-                   ROUND(AVG(p.payment_value), 2) as avg_payment
-            FROM olist_orders o
-            JOIN olist_customers c ON o.customer_id = c.customer_id
-            JOIN olist_order_payments p ON o.order_id = p.order_id
-            GROUP BY c.customer_state
-            ORDER BY total_orders DESC;
-        """,
-        "Payment_Analysis": """
-            SELECT p.payment_type, COUNT(*) as transaction_count,
-                   ROUND(AVG(p.payment_value), 2) as avg_payment,
-                   MIN(p.payment_value) as min_payment,
-                   MAX(p.payment_value) as max_payment
-            FROM olist_order_payments p
-            JOIN olist_orders o ON p.order_id = o.order_id
-            JOIN olist_customers c ON o.customer_id = c.customer_id
-            GROUP BY p.payment_type
-            ORDER BY transaction_count DESC;
-        """
-    }
-    
-    filename = "exports/olist_report.xlsx"
+def write_excel_report(filename, sheets):
+    """Write {sheet_name: DataFrame} to filename with frozen headers, filters and colour scales"""
+    import pandas as pd
+    from openpyxl import load_workbook
+    from openpyxl.formatting.rule import ColorScaleRule
+
+    os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
     with pd.ExcelWriter(filename, engine="openpyxl") as writer:
-        for sheet_name, query in queries.items():
-            df = run_query(query)
+        for sheet_name, df in sheets.items():
             df.to_excel(writer, sheet_name=sheet_name[:31], index=False)
     
     wb = load_workbook(filename)
@@ -222,7 +359,46 @@ def export_to_excel():
                 ws.conditional_formatting.add(f"{col_letter}2:{col_letter}{ws.max_row}", rule)
     wb.save(filename)
 
+def export_to_excel():
+    sheets = {sheet_name: run_query(DATASETS[dataset]) for sheet_name, dataset in EXCEL_SHEETS.items()}
+    write_excel_report("exports/olist_report.xlsx", sheets)
+
+def run_all(force=False, start=None, end=None):
+    create_all_visualizations(force, start, end)
+    create_time_slider_chart(start, end)
+    export_to_excel()
+
+COMMANDS = {
+    "charts": create_all_visualizations,
+    "slider": create_time_slider_chart,
+    "excel": export_to_excel,
+    "all": run_all,
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Olist charts and Excel reports")
+    subparsers = parser.add_subparsers(dest="command")
+    charts = subparsers.add_parser("charts", help="render the PNG charts into charts/")
+    slider = subparsers.add_parser("slider", help="show the animated orders-by-state chart")
+    subparsers.add_parser("excel", help="write exports/olist_report.xlsx")
+    run_everything = subparsers.add_parser("all", help="run charts, slider and excel (default)")
+    for sub in (charts, run_everything):
+        sub.add_argument("--force", action="store_true",
+                         help="re-render charts even if their data has not changed")
+    for sub in (charts, slider, run_everything):
+        sub.add_argument("--start", type=date.fromisoformat,
+                         help="only include orders purchased on or after this date (YYYY-MM-DD)")
+        sub.add_argument("--end", type=date.fromisoformat,
+                         help="only include orders purchased before this date (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+    command = args.command or "all"
+    options = {}
+    if command in ("charts", "all"):
+        options["force"] = getattr(args, "force", False)
+    if command in ("charts", "slider", "all"):
+        options["start"] = getattr(args, "start", None)
+        options["end"] = getattr(args, "end", None)
+    COMMANDS[command](**options)
+
 if __name__ == "__main__":
-    create_all_visualizations()
-    create_time_slider_chart()
-    export_to_excel()
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -0,0 +1,379 @@
+import os
+import io
+import re
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from aiohttp import web
+from dotenv import load_dotenv
+import db
+from analytics import DATASETS, dataset_query
+from main import load_named_queries
+
+load_dotenv()
+
+API_HOST = os.getenv("API_HOST", "0.0.0.0")
+API_PORT = int(os.getenv("API_PORT", "8080"))
+BATCH_SIZE = int(os.getenv("API_BATCH_SIZE", "10000"))
+# Finished responses up to CACHE_ENTRY_MAX_BYTES are kept, LRU, up to CACHE_MAX_BYTES in total
+CACHE_MAX_BYTES = int(os.getenv("API_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_ENTRY_MAX_BYTES = int(os.getenv("API_CACHE_ENTRY_MAX_BYTES", str(8 * 1024 * 1024)))
+# How far the query may run ahead of the slowest client reading its result
+STREAM_BUFFER_BYTES = int(os.getenv("API_STREAM_BUFFER_BYTES", str(4 * 1024 * 1024)))
+# How long a table version lookup is reused before pg_stat_user_tables is asked again
+VERSION_TTL = float(os.getenv("API_VERSION_TTL", "1"))
+
+CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+
+# Arrow types by Postgres type OID, so the stream schema does not depend on which values
+# happen to be in the first batch. NUMERIC is float64 because db.records_frame converts it.
+ARROW_TYPES = {
+    16: ("bool_",),
+    20: ("int64",), 21: ("int64",), 23: ("int64",),
+    700: ("float64",), 701: ("float64",), 1700: ("float64",),
+    18: ("string",), 19: ("string",), 25: ("string",), 1042: ("string",), 1043: ("string",), 2950: ("string",),
+    1082: ("date32",),
+    1114: ("timestamp", "us"),
+    1184: ("timestamp", "us", "UTC"),
+    1186: ("duration", "us"),
+}
+
+TABLE_VERSION_QUERY = """
+SELECT s.relname, s.n_tup_ins, s.n_tup_upd, s.n_tup_del, c.relfilenode
+FROM pg_stat_user_tables s
+JOIN pg_class c ON c.oid = s.relid
+WHERE s.relname LIKE ANY(%s)
+ORDER BY s.relname
+"""
+
+
+def fetch_table_versions(tables):
+    """Row-change counters and storage ids of the tables (and their partitions) a query reads"""
+    # Stats are per server and are not replayed on replicas, so always ask the primary
+    with db.pooled_connection("primary") as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(TABLE_VERSION_QUERY, ([f"{table}%" for table in tables],))
+            return [list(row) for row in cursor.fetchall()]
+
+
+def encoded_stream(sql, params, fmt):
+    """Run sql and yield the result as NDJSON or Arrow IPC stream chunks"""
+    writer = None
+    if fmt == "arrow":
+        import pyarrow as pa
+        sink = io.BytesIO()
+
+    # Read where the ETag's table versions come from: a lagging replica would return
+    # older rows under the ETag of the current data, and they would be cached as such
+    for columns, rows in db.stream_query(sql, params, BATCH_SIZE, endpoint="primary"):
+        df = db.records_frame(columns, rows)
+        if fmt == "ndjson":
+            if len(df):
+                yield df.to_json(orient="records", lines=True, date_format="iso").rstrip("\n").encode() + b"\n"
+            continue
+        if writer is None:
+            schema = arrow_schema(columns, df)
+            writer = pa.ipc.new_stream(sink, schema)
+        writer.write_batch(pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False))
+        yield take_bytes(sink)
+
+    if writer is not None:
+        writer.close()
+        yield take_bytes(sink)
+
+
+def arrow_schema(columns, df):
+    """Arrow schema from the cursor's column types; types not in ARROW_TYPES are inferred from df"""
+    import pyarrow as pa
+    inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    fields = []
+    for i, column in enumerate(columns):
+        if column.type_code in ARROW_TYPES:
+            name, *args = ARROW_TYPES[column.type_code]
+            fields.append((column.name, getattr(pa, name)(*args)))
+        else:
+            fields.append((column.name, inferred.field(i).type))
+    return pa.schema(fields)
+
+
+def close_stream(chunks):
+    """Close an encoded_stream, returning its pooled connection, once no step of it is running
+
+    After a cancellation the last next() may still be running in its worker thread.
+    """
+    while chunks.gi_running:
+        time.sleep(0.01)
+    chunks.close()
+
+
+def take_bytes(sink):
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+class SharedResult:
+    """Chunks of one response, readable by any number of requests while it is still being produced
+
+    Chunks are kept (so late requests and the cache can replay the whole response) until
+    they add up to more than CACHE_ENTRY_MAX_BYTES. After that only chunks some reader has
+    not taken yet are held, and no new readers can join. The producer waits whenever the
+    slowest reader falls more than STREAM_BUFFER_BYTES behind.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.ends = []  # running byte total after each chunk
+        self.dropped = 0  # chunks trimmed from the front of self.chunks
+        self.size = 0
+        self.retained = True
+        self.readers = {}  # reader -> number of the next chunk it will take
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Condition()
+
+    def behind(self):
+        """Bytes the slowest reader has still to take"""
+        if not self.readers:
+            return 0
+        slowest = min(self.readers.values())
+        return self.size - (self.ends[slowest - 1] if slowest else 0)
+
+    async def add(self, chunk):
+        """Append chunk once readers have caught up; False when nobody can read it any more"""
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.behind() <= STREAM_BUFFER_BYTES)
+            if not self.retained and not self.readers:
+                return False
+            self.chunks.append(chunk)
+            self.size += len(chunk)
+            self.ends.append(self.size)
+            if self.size > CACHE_ENTRY_MAX_BYTES:
+                self.retained = False
+                keep_from = min(self.readers.values(), default=self.dropped + len(self.chunks))
+                del self.chunks[:keep_from - self.dropped]
+                self.dropped = keep_from
+            self.changed.notify_all()
+            return True
+
+    async def finish(self, error=None):
+        async with self.changed:
+            self.done = True
+            self.error = error
+            self.changed.notify_all()
+
+    async def read(self):
+        reader = object()
+        self.readers[reader] = self.dropped
+        try:
+            while True:
+                async with self.changed:
+                    await self.changed.wait_for(
+                        lambda: self.readers[reader] < self.dropped + len(self.chunks) or self.done)
+                    pending = self.chunks[self.readers[reader] - self.dropped:]
+                    self.readers[reader] += len(pending)
+                    done, error = self.done, self.error
+                    self.changed.notify_all()
+                for chunk in pending:
+                    yield chunk
+                if done:
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            async with self.changed:
+                del self.readers[reader]
+                self.changed.notify_all()
+
+
+class ReportService:
+    def __init__(self):
+        # One worker and one semaphore slot per pooled connection, so the pool is never exhausted
+        self.executor = ThreadPoolExecutor(max_workers=db.POOL_SIZE)
+        self.slots = asyncio.Semaphore(db.POOL_SIZE)
+        self.inflight = {}
+        self.tasks = set()
+        self.cache = OrderedDict()
+        self.cache_bytes = 0
+        self.versions = {}
+        self.queries = load_named_queries("queries.sql")
+        self.windowed_queries = load_named_queries("windowed_queries.sql")
+
+    async def run_blocking(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def table_versions(self, sql):
+        tables = tuple(sorted(set(re.findall(r"\bolist_\w+", sql))))
+        cached = self.versions.get(tables)
+        if cached is not None and time.monotonic() - cached[0] < VERSION_TTL:
+            return cached[1]
+        async with self.slots:
+            versions = await self.run_blocking(fetch_table_versions, tables)
+        self.versions[tables] = (time.monotonic(), versions)
+        return versions
+
+    def cache_get(self, etag):
+        result = self.cache.get(etag)
+        if result is not None:
+            self.cache.move_to_end(etag)
+        return result
+
+    def cache_put(self, etag, result):
+        if result.size > CACHE_ENTRY_MAX_BYTES:
+            return
+        self.cache[etag] = result
+        self.cache_bytes += result.size
+        while self.cache_bytes > CACHE_MAX_BYTES:
+            _, evicted = self.cache.popitem(last=False)
+            self.cache_bytes -= evicted.size
+
+    async def produce(self, etag, result, sql, params, fmt):
+        chunks = encoded_stream(sql, params, fmt)
+        try:
+            async with self.slots:
+                try:
+                    while True:
+                        chunk = await self.run_blocking(next, chunks, None)
+                        if chunk is None:
+                            break
+                        if not await result.add(chunk):
+                            raise RuntimeError("every client reading this report has gone")
+                finally:
+                    # Return the pooled connection before the slot, or the next producer can find the pool empty
+                    await self.run_blocking(close_stream, chunks)
+        except asyncio.CancelledError:
+            await result.finish(RuntimeError("report generation was cancelled"))
+            raise
+        except Exception as e:
+            await result.finish(e)
+        else:
+            await result.finish()
+            if result.retained:
+                self.cache_put(etag, result)
+        finally:
+            if self.inflight.get(etag) is result:
+                del self.inflight[etag]
+
+    async def respond(self, request, key, sql, params):
+        fmt = request.query.get("format", "ndjson")
+        if fmt not in CONTENT_TYPES:
+            raise web.HTTPBadRequest(text=f"format must be one of {', '.join(CONTENT_TYPES)}")
+        if fmt == "arrow":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise web.HTTPNotAcceptable(text="Arrow output needs pyarrow installed")
+
+        versions = await self.table_versions(sql)
+        fingerprint = json.dumps([key, fmt, params, versions], default=str, sort_keys=True)
+        etag = '"' + hashlib.sha256(fingerprint.encode()).hexdigest()[:32] + '"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "Content-Type": CONTENT_TYPES[fmt]}
+        if etag in request.headers.get("If-None-Match", ""):
+            return web.Response(status=304, headers={"ETag": etag})
+
+        cached = self.cache_get(etag)
+        result = cached or self.inflight.get(etag)
+        if result is None or not result.retained:
+            # A result that outgrew its buffer cannot be replayed from the start, so run it again
+            result = SharedResult()
+            self.inflight[etag] = result
+            task = asyncio.create_task(self.produce(etag, result, sql, params, fmt))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+        chunks = result.read()
+        try:
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                first = b""
+            except Exception as e:
+                return web.json_response({"error": str(e)}, status=500)
+
+            response = web.StreamResponse(headers=headers)
+            response.headers["X-Cache"] = "HIT" if cached is not None else "MISS"
+            await response.prepare(request)
+            await response.write(first)
+            try:
+                async for chunk in chunks:
+                    await response.write(chunk)
+            except Exception:
+                # Headers are already sent; dropping the connection tells the client the body is incomplete
+                request.transport.close()
+                raise
+            await response.write_eof()
+            return response
+        finally:
+            # Unregister from the result right away, so a client that disconnects stops pacing the producer
+            await chunks.aclose()
+
+    async def list_queries(self, request):
+        return web.json_response([
+            {"id": number, "title": title, "windowed": number in self.windowed_queries}
+            for number, (title, _) in sorted(self.queries.items())
+        ])
+
+    async def get_query(self, request):
+        number = int(request.match_info["number"])
+        if number not in self.queries:
+            raise web.HTTPNotFound(text=f"No query {number} in queries.sql")
+        start, end = parse_window(request)
+        if start or end:
+            if number not in self.windowed_queries:
+                raise web.HTTPBadRequest(text=f"Query {number} has no date-windowed variant")
+            if not (start and end):
+                raise web.HTTPBadRequest(text="start and end must be given together")
+            return await self.respond(request, f"query:{number}", self.windowed_queries[number][1],
+                                      {"start": start, "end": end})
+        return await self.respond(request, f"query:{number}", self.queries[number][1], {})
+
+    async def list_datasets(self, request):
+        return web.json_response([
+            {"name": name, "windowed": "{window}" in sql} for name, sql in DATASETS.items()
+        ])
+
+    async def get_dataset(self, request):
+        name = request.match_info["name"]
+        if name not in DATASETS:
+            raise web.HTTPNotFound(text=f"No dataset {name}")
+        start, end = parse_window(request)
+        if (start or end) and "{window}" not in DATASETS[name]:
+            raise web.HTTPBadRequest(text=f"Dataset {name} cannot be filtered by date")
+        sql, params = dataset_query(name, start, end)
+        return await self.respond(request, f"dataset:{name}", sql.strip().rstrip(";"), params)
+
+    async def close(self, app):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_window(request):
+    try:
+        start = request.query.get("start")
+        end = request.query.get("end")
+        return (date.fromisoformat(start) if start else None,
+                date.fromisoformat(end) if end else None)
+    except ValueError:
+        raise web.HTTPBadRequest(text="start and end must be YYYY-MM-DD dates")
+
+
+def create_app():
+    service = ReportService()
+    app = web.Application()
+    app.router.add_get("/queries", service.list_queries)
+    app.router.add_get(r"/queries/{number:\d+}", service.get_query)
+    app.router.add_get("/datasets", service.list_datasets)
+    app.router.add_get("/datasets/{name}", service.get_dataset)
+    app.on_cleanup.append(service.close)
+    return app
+
+
+if __name__ == "__main__":
+    web.run_app(create_app(), host=API_HOST, port=API_PORT)
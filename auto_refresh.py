@@ -3,8 +3,8 @@ import time
 import random
 import uuid
 from datetime import datetime, timedelta
-import psycopg2
 from dotenv import load_dotenv
+from db import connect_primary
 
 load_dotenv()
 
@@ -17,7 +17,8 @@ class WorkingDataGenerator:
         print(f"User: {os.getenv('DB_USER', 'Not set')}")
         
         # Connect to Superset database - using Docker container names
-        self.conn = psycopg2.connect(
+        # Writes always go to the primary, never to the DB_READ_HOST replica
+        self.conn = connect_primary(
             dbname=os.getenv("DB_NAME", "superset"),  # Default to superset
             user=os.getenv("DB_USER", "superset"),    # Default to superset user
             password=os.getenv("DB_PASSWORD", "superset"),  # Default to superset password
@@ -0,0 +1,211 @@
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from db import stream_frame
+from analytics import write_excel_report
+
+# Each table is read once; everything below works on these frames in pandas/NumPy.
+# customer_unique_id identifies a person across orders (customer_id is per order);
+# it falls back to customer_id where it is missing, e.g. in scale_generator.py schemas.
+TABLE_QUERIES = {
+    "customers": """
+        SELECT customer_id, COALESCE(customer_unique_id, customer_id) AS customer_unique_id, customer_state
+        FROM olist_customers
+    """,
+    "orders": """
+        SELECT order_id, customer_id, order_status, order_purchase_timestamp,
+               order_delivered_customer_date, order_estimated_delivery_date
+        FROM olist_orders
+        WHERE order_purchase_timestamp IS NOT NULL
+    """,
+    "payments": "SELECT order_id, payment_value FROM olist_order_payments",
+    "items": "SELECT DISTINCT order_id, seller_id FROM olist_order_items",
+}
+
+EXCLUDED_STATUSES = ["canceled", "unavailable"]
+
+# Most customers order once, so frequency is scored on fixed bins rather than quintiles:
+# 1 order -> 1, 2 -> 2, 3 -> 3, 4-5 -> 4, 6+ -> 5
+FREQUENCY_BINS = [2, 3, 4, 6]
+
+# (segment, minimum R score, minimum F score), checked in order; first match wins
+RFM_SEGMENTS = [
+    ("Champions", 4, 4),
+    ("Loyal", 3, 3),
+    ("New", 4, 1),
+    ("Potential Loyalists", 3, 1),
+    ("At Risk", 1, 3),
+    ("Hibernating", 2, 1),
+    ("Lost", 1, 1),
+]
+
+
+def load_tables():
+    tables = {}
+    for name, query in TABLE_QUERIES.items():
+        tables[name] = stream_frame(query)
+    orders = tables["orders"]
+    for column in ["order_purchase_timestamp", "order_delivered_customer_date", "order_estimated_delivery_date"]:
+        orders[column] = pd.to_datetime(orders[column])
+    return tables
+
+
+def customer_orders(tables):
+    """Valid orders with the customer's unique id, state and order value"""
+    customers = tables["customers"].set_index("customer_id")
+    orders = tables["orders"]
+    orders = orders[~orders["order_status"].isin(EXCLUDED_STATUSES)]
+    order_value = tables["payments"].groupby("order_id")["payment_value"].sum()
+    return pd.DataFrame({
+        "order_id": orders["order_id"].to_numpy(),
+        "customer_unique_id": customers["customer_unique_id"].reindex(orders["customer_id"]).to_numpy(),
+        "customer_state": customers["customer_state"].reindex(orders["customer_id"]).to_numpy(),
+        "purchased_at": orders["order_purchase_timestamp"].to_numpy(),
+        "value": order_value.reindex(orders["order_id"]).fillna(0).to_numpy(),
+    }).dropna(subset=["customer_unique_id"])
+
+
+def score(values, ascending=True):
+    """Quintile score 1-5, ties broken by position"""
+    ranks = values.rank(method="first", pct=True, ascending=ascending)
+    return np.ceil(ranks * 5).clip(1, 5).astype(int)
+
+
+def rfm_segments(orders, snapshot=None):
+    """Recency/frequency/monetary per customer with 1-5 scores and a named segment"""
+    if snapshot is None:
+        snapshot = orders["purchased_at"].max() + pd.Timedelta(days=1)
+    rfm = orders.groupby("customer_unique_id").agg(
+        last_purchase=("purchased_at", "max"),
+        frequency=("order_id", "nunique"),
+        monetary=("value", "sum"),
+        customer_state=("customer_state", "last"),
+    )
+    rfm["recency_days"] = (snapshot - rfm["last_purchase"]).dt.days
+    rfm["r_score"] = score(rfm["recency_days"], ascending=False)
+    rfm["f_score"] = np.searchsorted(FREQUENCY_BINS, rfm["frequency"].to_numpy(), side="right") + 1
+    rfm["m_score"] = score(rfm["monetary"])
+    rfm["rfm_score"] = rfm["r_score"] * 100 + rfm["f_score"] * 10 + rfm["m_score"]
+
+    r, f = rfm["r_score"].to_numpy(), rfm["f_score"].to_numpy()
+    conditions = [(r >= min_r) & (f >= min_f) for _, min_r, min_f in RFM_SEGMENTS]
+    rfm["segment"] = np.select(conditions, [name for name, _, _ in RFM_SEGMENTS], default="Lost")
+    return rfm.reset_index()
+
+
+def segment_summary(rfm):
+    summary = rfm.groupby("segment").agg(
+        customers=("customer_unique_id", "size"),
+        avg_recency_days=("recency_days", "mean"),
+        avg_frequency=("frequency", "mean"),
+        avg_monetary=("monetary", "mean"),
+        revenue=("monetary", "sum"),
+    )
+    summary = summary.round(2)
+    summary["revenue_share"] = (summary["revenue"] / summary["revenue"].sum()).round(4)
+    return summary.sort_values("revenue", ascending=False).reset_index()
+
+
+def retention_cohorts(orders):
+    """Share of each first-purchase month's customers who ordered again N months later
+
+    Periods past the last month in the data are left empty (NaN) rather than 0%.
+    """
+    month = orders["purchased_at"].dt.year * 12 + orders["purchased_at"].dt.month - 1
+    cohort = month.groupby(orders["customer_unique_id"]).transform("min")
+    active = pd.DataFrame({
+        "customer_unique_id": orders["customer_unique_id"],
+        "cohort": cohort,
+        "period": month - cohort,
+    }).drop_duplicates()
+    counts = active.groupby(["cohort", "period"]).size().unstack(fill_value=0)
+    unobserved = counts.index.to_numpy()[:, None] + counts.columns.to_numpy()[None, :] > month.max()
+    retention = counts.div(counts[0], axis=0).mask(unobserved).round(4)
+    retention.insert(0, "customers", counts[0])
+    retention.index = [f"{code // 12}-{code % 12 + 1:02d}" for code in retention.index]
+    retention.index.name = "cohort"
+    retention.columns = ["customers"] + [f"month_{period}" for period in retention.columns[1:]]
+    return retention.reset_index()
+
+
+def delivery_sla(tables):
+    """Delivered orders flagged late when they arrived after the estimated delivery date"""
+    orders = tables["orders"]
+    delivered = orders[(orders["order_status"] == "delivered")
+                       & orders["order_delivered_customer_date"].notna()
+                       & orders["order_estimated_delivery_date"].notna()]
+    customers = tables["customers"].set_index("customer_id")
+    delay = delivered["order_delivered_customer_date"].dt.normalize() - delivered["order_estimated_delivery_date"].dt.normalize()
+    return pd.DataFrame({
+        "order_id": delivered["order_id"].to_numpy(),
+        "customer_state": customers["customer_state"].reindex(delivered["customer_id"]).to_numpy(),
+        "delivery_days": ((delivered["order_delivered_customer_date"] - delivered["order_purchase_timestamp"])
+                          .dt.total_seconds() / 86400).to_numpy(),
+        "days_late": (delay.dt.days).clip(lower=0).to_numpy(),
+        "late": (delay.dt.days > 0).to_numpy(),
+    })
+
+
+def sla_breaches(sla, by):
+    grouped = sla.groupby(by)
+    summary = grouped.agg(
+        delivered_orders=("order_id", "size"),
+        late_orders=("late", "sum"),
+        avg_delivery_days=("delivery_days", "mean"),
+    )
+    summary["late_rate"] = summary["late_orders"] / summary["delivered_orders"]
+    late = sla[sla["late"]]
+    summary["avg_days_late"] = late.groupby(by)["days_late"].mean().reindex(summary.index).fillna(0)
+    return summary.sort_values(["late_orders", "late_rate"], ascending=False).round(3).reset_index()
+
+
+def seller_sla_breaches(sla, tables, min_orders=1):
+    per_seller = tables["items"].merge(sla, on="order_id")
+    summary = sla_breaches(per_seller, "seller_id")
+    return summary[summary["delivered_orders"] >= min_orders].reset_index(drop=True)
+
+
+def build_report(min_seller_orders=10):
+    started = time.perf_counter()
+    tables = load_tables()
+    loaded = time.perf_counter()
+    orders = customer_orders(tables)
+    rfm = rfm_segments(orders)
+    sla = delivery_sla(tables)
+    report = {
+        "RFM_Segments": segment_summary(rfm),
+        "Retention_Cohorts": retention_cohorts(orders),
+        "SLA_By_State": sla_breaches(sla, "customer_state"),
+        "SLA_By_Seller": seller_sla_breaches(sla, tables, min_seller_orders),
+        "RFM_Customers": rfm.drop(columns=["last_purchase"]),
+    }
+    done = time.perf_counter()
+    print(f"Loaded {sum(len(t) for t in tables.values())} rows in {loaded - started:.1f}s, "
+          f"computed in {done - loaded:.1f}s")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RFM segments, retention cohorts and delivery SLA breaches")
+    parser.add_argument("--excel", action="store_true", help="write exports/olist_customer_behaviour.xlsx")
+    parser.add_argument("--customers", action="store_true", help="include the per-customer RFM sheet in the export")
+    parser.add_argument("--min-seller-orders", type=int, default=10,
+                        help="only list sellers with at least this many delivered orders")
+    args = parser.parse_args()
+
+    report = build_report(args.min_seller_orders)
+    for name, df in report.items():
+        if name == "RFM_Customers":
+            continue
+        print(f"\n=== {name} ===")
+        print(df.head(20))
+
+    if args.excel:
+        sheets = {name: df for name, df in report.items() if args.customers or name != "RFM_Customers"}
+        write_excel_report("exports/olist_customer_behaviour.xlsx", sheets)
+        print("\nSaved exports/olist_customer_behaviour.xlsx")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import time
+import uuid
+import threading
+from contextlib import contextmanager
+from decimal import Decimal
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Reads go to DB_READ_HOST when it is set, reachable and no more than
+# DB_MAX_REPLICA_LAG seconds behind; everything else uses the DB_* primary.
+MAX_REPLICA_LAG = float(os.getenv("DB_MAX_REPLICA_LAG", "30"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("DB_HEALTH_CHECK_INTERVAL", "5"))
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+
+# Everything received has been replayed only counts as caught up while the WAL receiver
+# is streaming; a disconnected replica would otherwise look current forever.
+REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+         AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 'Infinity')
+END
+"""
+
+# Shared by every thread (the API runs queries from a thread pool), so guarded by _lock
+_lock = threading.Lock()
+_pools = {}
+_replica = {"checked_at": None, "healthy": False, "lag": None}
+
+
+def primary_settings():
+    return {
+        "dbname": os.getenv("DB_NAME"),
+        "user": os.getenv("DB_USER"),
+        "password": os.getenv("DB_PASSWORD"),
+        "host": os.getenv("DB_HOST"),
+        "port": os.getenv("DB_PORT"),
+    }
+
+
+def replica_settings():
+    """Connection settings for the read replica, or None when no replica is configured"""
+    if not os.getenv("DB_READ_HOST"):
+        return None
+    primary = primary_settings()
+    return {
+        "dbname": os.getenv("DB_READ_NAME", primary["dbname"]),
+        "user": os.getenv("DB_READ_USER", primary["user"]),
+        "password": os.getenv("DB_READ_PASSWORD", primary["password"]),
+        "host": os.getenv("DB_READ_HOST"),
+        "port": os.getenv("DB_READ_PORT", primary["port"]),
+    }
+
+
+def connect_primary(**overrides):
+    """Open a dedicated connection to the primary, for long-lived writers"""
+    import psycopg2
+    return psycopg2.connect(**{**primary_settings(), **overrides})
+
+
+def get_pool(endpoint):
+    import psycopg2.pool
+    with _lock:
+        if endpoint not in _pools:
+            settings = replica_settings() if endpoint == "replica" else primary_settings()
+            _pools[endpoint] = psycopg2.pool.ThreadedConnectionPool(1, POOL_SIZE, **settings)
+        return _pools[endpoint]
+
+
+def discard_pool(endpoint):
+    """Stop handing out connections from endpoint's pool
+
+    The pool is not closed: connections other threads are still using go back to it
+    (and are closed) as they finish, and its idle connections close when it is collected.
+    """
+    with _lock:
+        _pools.pop(endpoint, None)
+
+
+@contextmanager
+def pooled_connection(endpoint):
+    """Borrow a connection from the primary or replica pool and end its transaction on return"""
+    pool = get_pool(endpoint)
+    conn = pool.getconn()
+    try:
+        yield conn
+        if not conn.closed:
+            conn.commit()
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        with _lock:
+            retired = _pools.get(endpoint) is not pool
+        pool.putconn(conn, close=retired or bool(conn.closed))
+
+
+def error_summary(error):
+    message = str(error).strip()
+    return message.splitlines()[0] if message else type(error).__name__
+
+
+def mark_replica_down(reason):
+    with _lock:
+        if _replica["healthy"] or _replica["checked_at"] is None:
+            print(f"⚠️ Read replica unavailable ({reason}), reading from primary")
+        _replica.update(checked_at=time.monotonic(), healthy=False, lag=None)
+    discard_pool("replica")
+
+
+def replica_is_usable():
+    """Check (at most every HEALTH_CHECK_INTERVAL seconds) that the replica is up and caught up"""
+    import psycopg2
+    if replica_settings() is None:
+        return False
+    now = time.monotonic()
+    with _lock:
+        if _replica["checked_at"] is not None and now - _replica["checked_at"] < HEALTH_CHECK_INTERVAL:
+            return _replica["healthy"]
+
+    try:
+        with pooled_connection("replica") as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(REPLICA_LAG_QUERY)
+                lag = float(cursor.fetchone()[0])
+    except psycopg2.Error as e:
+        mark_replica_down(error_summary(e))
+        return False
+
+    healthy = lag <= MAX_REPLICA_LAG
+    with _lock:
+        if not healthy and (_replica["healthy"] or _replica["checked_at"] is None):
+            print(f"⚠️ Read replica is {lag:.0f}s behind (limit {MAX_REPLICA_LAG:.0f}s), reading from primary")
+        _replica.update(checked_at=now, healthy=healthy, lag=lag)
+    return healthy
+
+
+def read_endpoint():
+    return "replica" if replica_is_usable() else "primary"
+
+
+def read_query(query, params=None):
+    """Run a read-only query on the replica when usable, otherwise on the primary"""
+    import psycopg2
+    import psycopg2.pool
+    import pandas as pd
+    endpoint = read_endpoint()
+    try:
+        with pooled_connection(endpoint) as conn:
+            return pd.read_sql_query(query, conn, params=params or None)
+    except psycopg2.OperationalError as e:
+        if endpoint != "replica":
+            raise
+        mark_replica_down(error_summary(e))
+    except psycopg2.pool.PoolError:
+        # Every replica connection is busy; the replica itself is fine
+        if endpoint != "replica":
+            raise
+    with pooled_connection("primary") as conn:
+        return pd.read_sql_query(query, conn, params=params or None)
+
+
+def stream_query(query, params=None, batch_size=10000, endpoint=None):
+    """Yield (columns, rows) batches from a server-side cursor on endpoint (default: the read endpoint)
+
+    columns is the cursor description (each column has .name and the Postgres .type_code).
+    At least one batch is yielded, with an empty row list when the query returns nothing.
+    """
+    endpoint = endpoint or read_endpoint()
+    with pooled_connection(endpoint) as conn:
+        with conn.cursor(name=f"stream_{uuid.uuid4().hex}") as cursor:
+            cursor.itersize = batch_size
+            cursor.execute(query, params or None)
+            first = True
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows and not first:
+                    break
+                yield cursor.description, rows
+                if not rows:
+                    break
+                first = False
+
+
+def records_frame(columns, rows):
+    """Build a DataFrame from cursor rows, turning NUMERIC (Decimal) columns into floats"""
+    import pandas as pd
+    df = pd.DataFrame.from_records(rows, columns=[column.name for column in columns])
+    for column in df.columns:
+        values = df[column].dropna()
+        if df[column].dtype == object and len(values) and isinstance(values.iloc[0], Decimal):
+            df[column] = df[column].astype(float)
+    return df
+
+
+def stream_frame(query, params=None, batch_size=50000):
+    """Read a whole result through stream_query and return it as one DataFrame"""
+    import pandas as pd
+    frames = [records_frame(columns, rows) for columns, rows in stream_query(query, params, batch_size)]
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+if __name__ == "__main__":
+    replica = replica_settings()
+    primary = primary_settings()
+    print(f"Primary: {primary['host']}:{primary['port']}/{primary['dbname']}")
+    if replica is None:
+        print("Replica: not configured (set DB_READ_HOST), reads go to primary")
+    else:
+        print(f"Replica: {replica['host']}:{replica['port']}/{replica['dbname']}")
+        endpoint = read_endpoint()
+        lag = _replica["lag"]
+        print(f"Replica lag: {'unknown' if lag is None else f'{lag:.1f}s'}; reads go to {endpoint}")
@@ -1,30 +1,19 @@
-import psycopg2
-import pandas as pd
 import os
+import argparse
+from datetime import date
 from dotenv import load_dotenv
 import re
+from db import read_query
 
 load_dotenv()
 
 DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
 
 
-def run_query(query):
-    """Execute a SQL query and return results as a pandas DataFrame."""
+def run_query(query, params=None):
+    """Execute a SQL query (on the read replica when available) and return results as a pandas DataFrame."""
     try:
-        conn = psycopg2.connect(
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            host=DB_HOST,
-            port=DB_PORT
-        )
-        df = pd.read_sql_query(query, conn)
-        conn.close()
+        df = read_query(query, params)
 
         for col in df.columns:
             if "id" in col.lower():
@@ -36,24 +25,42 @@ def run_query(query):
         return None
 
 
-def load_queries(filename="queries.sql"):
-    """Read queries from a .sql file and split them by semicolon, ignoring comments."""
+def load_named_queries(filename="queries.sql"):
+    """Map each query number to its (title, sql), taken from the '-- N. Title' comment above it."""
     with open(filename, "r", encoding="utf-8") as f:
         content = f.read()
 
-    content = re.sub(r"--.*", "", content)
-
-    queries = [q.strip() for q in content.split(";") if q.strip()]
-    return queries
+    named = {}
+    pattern = re.compile(r"^--\s*(\d+)\.\s*(.+?)\s*$(.*?)(?=^--\s*\d+\.|\Z)", re.M | re.S)
+    for number, title, body in pattern.findall(content):
+        sql = re.sub(r"--.*", "", body).strip().rstrip(";").strip()
+        if sql:
+            named[int(number)] = (title, sql)
+    return named
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the report queries and print the results")
+    parser.add_argument("--start", type=date.fromisoformat,
+                        help="run the date-windowed reports from this purchase date (inclusive)")
+    parser.add_argument("--end", type=date.fromisoformat,
+                        help="run the date-windowed reports up to this purchase date (exclusive)")
+    args = parser.parse_args()
+    if (args.start is None) != (args.end is None):
+        parser.error("--start and --end must be given together")
+
     print("Connected to PostgreSQL database:", DB_NAME)
 
-    queries = load_queries("queries.sql")
+    if args.start:
+        queries = load_named_queries("windowed_queries.sql")
+        params = {"start": args.start, "end": args.end}
+    else:
+        queries = load_named_queries("queries.sql")
+        params = None
 
-    for i, query in enumerate(queries, 1):
+    # Numbered as in queries.sql, so the windowed reports keep their original numbers
+    for i, (title, query) in sorted(queries.items()):
         print(f"\n=== Query {i} Results ===")
-        df = run_query(query)
+        df = run_query(query, params)
         if df is not None:
             print(df.head(20))  
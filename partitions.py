@@ -0,0 +1,217 @@
+import argparse
+from datetime import date
+from db import connect_primary
+
+# Tables that can be converted and the column each one is range-partitioned on.
+# olist_order_items is left alone: it has no purchase timestamp, and the windowed
+# reports only bound o.order_purchase_timestamp, so item partitions would never be
+# pruned and every join probe would have to visit all of them.
+PARTITION_KEYS = {
+    "olist_orders": "order_purchase_timestamp",
+}
+
+# The old primary keys, extended with the partition key as Postgres requires for unique
+# indexes on partitioned tables. A unique index rather than a PRIMARY KEY, because that
+# would force the partition key NOT NULL and reject rows bound for the default partition.
+UNIQUE_KEYS = {
+    "olist_orders": ["order_id"],
+}
+
+INDEXED_COLUMNS = {
+    "olist_orders": ["order_purchase_timestamp", "customer_id"],
+}
+
+
+def month_start(day):
+    return date(day.year, day.month, 1)
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+
+def to_regclass(cursor, name):
+    cursor.execute("SELECT to_regclass(%s)", (name,))
+    return cursor.fetchone()[0] is not None
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def create_month_partitions(cursor, table, first_month, last_month):
+    """Create one partition per month from first_month to last_month inclusive
+
+    Rows for a missing month that already landed in the default partition (e.g. cron
+    skipped a run) are moved into the new partition, since Postgres refuses to create
+    a partition whose range overlaps rows in the default one.
+    """
+    key = PARTITION_KEYS[table]
+    default = f"{table}_default"
+    has_default = to_regclass(cursor, default)
+    month = first_month
+    created = 0
+    while month <= last_month:
+        name = partition_name(table, month)
+        bounds = (month, add_months(month, 1))
+        if not to_regclass(cursor, name):
+            moved = 0
+            if has_default:
+                cursor.execute(f"SELECT COUNT(*) FROM {default} WHERE {key} >= %s AND {key} < %s", bounds)
+                moved = cursor.fetchone()[0]
+            if moved:
+                cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+                cursor.execute(f"INSERT INTO {name} SELECT * FROM {default} WHERE {key} >= %s AND {key} < %s", bounds)
+                cursor.execute(f"DELETE FROM {default} WHERE {key} >= %s AND {key} < %s", bounds)
+                cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", bounds)
+                print(f"Moved {moved} rows for {month:%Y-%m} from {default} into {name}")
+            else:
+                cursor.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", bounds)
+            created += 1
+        month = add_months(month, 1)
+    return created
+
+
+def drop_foreign_keys_to(cursor, table):
+    """Partitioned tables cannot be referenced by order_id alone, so drop FKs pointing at table
+
+    Returns the dropped constraints as (table, name) pairs.
+    """
+    cursor.execute("""
+        SELECT conrelid::regclass::text, conname
+        FROM pg_constraint
+        WHERE contype = 'f' AND confrelid = to_regclass(%s)
+    """, (table,))
+    dropped = cursor.fetchall()
+    for referencing_table, constraint in dropped:
+        print(f"Dropping foreign key {constraint} on {referencing_table}")
+        cursor.execute(f"ALTER TABLE {referencing_table} DROP CONSTRAINT {constraint}")
+    return dropped
+
+
+def copy_outgoing_foreign_keys(cursor, source, target):
+    """Recreate source's own foreign keys (e.g. orders -> customers) on target
+
+    LIKE does not copy them, and partitioned tables can reference other tables.
+    """
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid)
+        FROM pg_constraint
+        WHERE contype = 'f' AND conrelid = to_regclass(%s)
+    """, (source,))
+    copied = cursor.fetchall()
+    for constraint, definition in copied:
+        cursor.execute(f"ALTER TABLE {target} ADD CONSTRAINT {constraint} {definition}")
+    return [constraint for constraint, _ in copied]
+
+
+def convert_table(conn, table, months_ahead, drop_old=False):
+    """Swap table for a monthly range-partitioned copy holding the same rows"""
+    key = PARTITION_KEYS[table]
+    old_table = f"{table}_unpartitioned"
+    with conn.cursor() as cursor:
+        if is_partitioned(cursor, table):
+            print(f"{table} is already partitioned")
+            return
+
+        cursor.execute(f"SELECT MIN({key}), COUNT(*) FROM {table}")
+        first, total = cursor.fetchone()
+        first_month = month_start(first) if first else month_start(date.today())
+        last_month = add_months(month_start(date.today()), months_ahead)
+
+        dropped = drop_foreign_keys_to(cursor, table)
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        cursor.execute(
+            f"CREATE TABLE {table} (LIKE {old_table} INCLUDING DEFAULTS) PARTITION BY RANGE ({key})"
+        )
+        created = create_month_partitions(cursor, table, first_month, last_month)
+        cursor.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+        unique_key = ", ".join(UNIQUE_KEYS[table] + [key])
+        cursor.execute(f"CREATE UNIQUE INDEX {table}_unique_key ON {table} ({unique_key})")
+        for column in INDEXED_COLUMNS[table]:
+            cursor.execute(f"CREATE INDEX ON {table} ({column})")
+        cursor.execute(f"INSERT INTO {table} SELECT * FROM {old_table}")
+        # Added after the rows so each key is validated once, not per inserted row
+        foreign_keys = copy_outgoing_foreign_keys(cursor, old_table, table)
+        if drop_old:
+            cursor.execute(f"DROP TABLE {old_table}")
+        cursor.execute(f"ANALYZE {table}")
+    conn.commit()
+    kept = "dropped" if drop_old else f"kept as {old_table}"
+    print(f"✅ {table}: {total} rows moved into {created} monthly partitions "
+          f"({first_month:%Y-%m} to {last_month:%Y-%m}), old table {kept}")
+    print(f"   unique on ({unique_key})")
+    if foreign_keys:
+        print(f"   foreign keys kept: {', '.join(foreign_keys)}")
+    if dropped:
+        names = ", ".join(f"{constraint} on {referencing_table}" for referencing_table, constraint in dropped)
+        print(f"⚠️ Foreign keys to {table} were dropped and are NOT enforced any more: {names}")
+
+
+def create_ahead(conn, months_ahead):
+    """Make sure every partitioned table has partitions up to months_ahead from now"""
+    with conn.cursor() as cursor:
+        for table in PARTITION_KEYS:
+            if not is_partitioned(cursor, table):
+                continue
+            this_month = month_start(date.today())
+            created = create_month_partitions(cursor, table, this_month, add_months(this_month, months_ahead))
+            print(f"✅ {table}: partitions present through {add_months(this_month, months_ahead):%Y-%m} "
+                  f"({created} created)")
+    conn.commit()
+
+
+def show_status(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT parent.relname, child.relname,
+                   pg_get_expr(child.relpartbound, child.oid), child.reltuples::bigint
+            FROM pg_inherits i
+            JOIN pg_class parent ON parent.oid = i.inhparent
+            JOIN pg_class child ON child.oid = i.inhrelid
+            WHERE parent.relname = ANY(%s)
+            ORDER BY parent.relname, child.relname
+        """, (list(PARTITION_KEYS),))
+        rows = cursor.fetchall()
+    if not rows:
+        print("No partitioned Olist tables")
+    for parent, child, bound, estimate in rows:
+        print(f"{parent:<20} {child:<36} {bound:<70} ~{max(estimate, 0)} rows")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage monthly range partitions of the Olist tables")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="convert olist_orders to monthly partitions")
+    convert.add_argument("--months-ahead", type=int, default=3)
+    convert.add_argument("--drop-old", action="store_true", help="drop the unpartitioned copy after moving rows")
+    ahead = subparsers.add_parser("create-ahead", help="create future monthly partitions (run from cron)")
+    ahead.add_argument("--months-ahead", type=int, default=3)
+    subparsers.add_parser("status", help="list partitions and row estimates")
+    args = parser.parse_args()
+
+    conn = connect_primary()
+    try:
+        if args.command == "convert":
+            for table in PARTITION_KEYS:
+                convert_table(conn, table, args.months_ahead, args.drop_old)
+        elif args.command == "create-ahead":
+            create_ahead(conn, args.months_ahead)
+        else:
+            show_status(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+import io
+import os
+import argparse
+import binascii
+import numpy as np
+import pandas as pd
+from auto_refresh import WorkingDataGenerator
+from db import read_query
+
+TABLE_COLUMNS = {
+    "olist_customers": ["customer_id", "customer_city", "customer_state"],
+    "olist_sellers": ["sellerid", "sellercity", "sellerstate"],
+    "olist_products": ["product_id", "product_category_name"],
+    "olist_orders": [
+        "order_id", "customer_id", "order_status", "order_purchase_timestamp",
+        "order_approved_at", "order_delivered_carrier_date",
+        "order_delivered_customer_date", "order_estimated_delivery_date",
+    ],
+    "olist_order_items": [
+        "order_id", "order_item_id", "product_id", "seller_id",
+        "shipping_limit_date", "price", "freight_value",
+    ],
+    "olist_order_payments": [
+        "order_id", "payment_sequential", "payment_type",
+        "payment_installments", "payment_value",
+    ],
+    "olist_order_reviews": ["review_id", "order_id", "review_score"],
+}
+
+ORDER_OFFSETS = {
+    "order_approved_at": "approved_offset",
+    "order_delivered_carrier_date": "carrier_offset",
+    "order_delivered_customer_date": "customer_offset",
+    "order_estimated_delivery_date": "estimated_offset",
+}
+
+JITTER_SECONDS = 12 * 3600
+
+
+def make_ids(salt, index):
+    """Build 32-char hex ids from a 16-char salt and integer row indices"""
+    hexed = binascii.hexlify(np.ascontiguousarray(index, dtype=">u8").tobytes())
+    return np.char.add(salt, np.frombuffer(hexed, dtype="S16").astype("U16"))
+
+
+class ScaledDataGenerator(WorkingDataGenerator):
+    """Generate Olist-shaped datasets at a multiple of the real table sizes"""
+
+    def __init__(self, seed=None):
+        super().__init__()
+        self.rng = np.random.default_rng(seed)
+        self.fit_distributions()
+
+    def read(self, query):
+        # Fitting scans whole tables, so it goes to the replica; COPY writes use self.conn (primary)
+        return read_query(query)
+
+    def fit_distributions(self):
+        """Pull every distribution we sample from in one query per table"""
+        self.customers = self.read("SELECT customer_city, customer_state FROM olist_customers")
+        self.sellers = self.read("""
+            SELECT s.sellercity, s.sellerstate, COUNT(oi.order_id) AS sales
+            FROM olist_sellers s
+            LEFT JOIN olist_order_items oi ON oi.seller_id = s.sellerid
+            GROUP BY s.sellerid, s.sellercity, s.sellerstate
+        """)
+        self.products = self.read("""
+            SELECT p.product_category_name, COUNT(oi.order_id) AS sales
+            FROM olist_products p
+            LEFT JOIN olist_order_items oi ON oi.product_id = p.product_id
+            GROUP BY p.product_id, p.product_category_name
+        """)
+        self.orders = self.read("""
+            SELECT o.order_status,
+                   EXTRACT(EPOCH FROM o.order_purchase_timestamp) AS purchase_epoch,
+                   EXTRACT(EPOCH FROM o.order_approved_at - o.order_purchase_timestamp) AS approved_offset,
+                   EXTRACT(EPOCH FROM o.order_delivered_carrier_date - o.order_purchase_timestamp) AS carrier_offset,
+                   EXTRACT(EPOCH FROM o.order_delivered_customer_date - o.order_purchase_timestamp) AS customer_offset,
+                   EXTRACT(EPOCH FROM o.order_estimated_delivery_date - o.order_purchase_timestamp) AS estimated_offset,
+                   COALESCE(i.n, 0) AS item_count,
+                   COALESCE(p.n, 0) AS payment_count,
+                   COALESCE(r.n, 0) AS review_count
+            FROM olist_orders o
+            LEFT JOIN (SELECT order_id, COUNT(*) AS n FROM olist_order_items GROUP BY order_id) i
+                ON i.order_id = o.order_id
+            LEFT JOIN (SELECT order_id, COUNT(*) AS n FROM olist_order_payments GROUP BY order_id) p
+                ON p.order_id = o.order_id
+            LEFT JOIN (SELECT order_id, COUNT(*) AS n FROM olist_order_reviews GROUP BY order_id) r
+                ON r.order_id = o.order_id
+            WHERE o.order_purchase_timestamp IS NOT NULL
+        """)
+        self.items = self.read("""
+            SELECT oi.price, oi.freight_value,
+                   EXTRACT(EPOCH FROM oi.shipping_limit_date - o.order_purchase_timestamp) AS shipping_offset
+            FROM olist_order_items oi
+            JOIN olist_orders o ON oi.order_id = o.order_id
+            WHERE oi.price IS NOT NULL AND oi.freight_value IS NOT NULL
+        """)
+        self.payments = self.read("""
+            SELECT payment_type, payment_installments, payment_value
+            FROM olist_order_payments
+        """)
+        self.review_scores = self.read(
+            "SELECT review_score FROM olist_order_reviews WHERE review_score IS NOT NULL"
+        )["review_score"].to_numpy()
+
+        self.item_counts, self.item_count_p = self.empirical(self.orders["item_count"])
+        self.payment_counts, self.payment_count_p = self.empirical(self.orders["payment_count"])
+        self.review_rate = float((self.orders["review_count"] > 0).mean())
+        print(f"✅ Fitted on {len(self.orders)} orders, {len(self.items)} items, "
+              f"{len(self.payments)} payments, {len(self.customers)} customers")
+
+    @staticmethod
+    def empirical(series):
+        values, counts = np.unique(series.to_numpy(), return_counts=True)
+        return values, counts / counts.sum()
+
+    def bootstrap(self, df, n):
+        return df.iloc[self.rng.integers(0, len(df), n)].reset_index(drop=True)
+
+    def weighted_indices(self, cdf, n):
+        return np.searchsorted(cdf, self.rng.random(n) * cdf[-1], side="right")
+
+    def generate_dimension(self, table, source, columns, salt, start, n):
+        """Clone n rows of a dimension table, returning the frame and source row indices"""
+        src = self.rng.integers(0, len(source), n)
+        df = source.iloc[src][columns].reset_index(drop=True)
+        df.columns = TABLE_COLUMNS[table][1:]
+        df.insert(0, TABLE_COLUMNS[table][0], make_ids(salt, np.arange(start, start + n)))
+        return df, src
+
+    def generate_orders(self, start, n, salts, n_customers, product_cdf, seller_cdf):
+        """Generate one chunk of orders with their items, payments and reviews"""
+        order_index = np.arange(start, start + n)
+        order_ids = make_ids(salts["order"], order_index)
+
+        base = self.bootstrap(self.orders, n)
+        epoch = base["purchase_epoch"].to_numpy() + self.rng.uniform(-JITTER_SECONDS, JITTER_SECONDS, n)
+        purchase = pd.to_datetime(epoch, unit="s").floor("s")
+        orders = pd.DataFrame({
+            "order_id": order_ids,
+            "customer_id": make_ids(salts["customer"], self.rng.integers(0, n_customers, n)),
+            "order_status": base["order_status"].to_numpy(),
+            "order_purchase_timestamp": purchase,
+        })
+        for column, offset in ORDER_OFFSETS.items():
+            orders[column] = purchase + pd.to_timedelta(base[offset].to_numpy(), unit="s")
+
+        item_counts = self.rng.choice(self.item_counts, n, p=self.item_count_p)
+        item_order = np.repeat(np.arange(n), item_counts)
+        first_item = np.repeat(np.cumsum(item_counts) - item_counts, item_counts)
+        item_rows = self.bootstrap(self.items, len(item_order))
+        items = pd.DataFrame({
+            "order_id": order_ids[item_order],
+            "order_item_id": np.arange(len(item_order)) - first_item + 1,
+            "product_id": make_ids(salts["product"], self.weighted_indices(product_cdf, len(item_order))),
+            "seller_id": make_ids(salts["seller"], self.weighted_indices(seller_cdf, len(item_order))),
+            "shipping_limit_date": purchase[item_order]
+                + pd.to_timedelta(item_rows["shipping_offset"].to_numpy(), unit="s"),
+            "price": item_rows["price"].to_numpy(),
+            "freight_value": item_rows["freight_value"].to_numpy(),
+        })
+        order_totals = np.bincount(item_order, weights=items["price"] + items["freight_value"], minlength=n)
+
+        payment_counts = self.rng.choice(self.payment_counts, n, p=self.payment_count_p)
+        payment_order = np.repeat(np.arange(n), payment_counts)
+        first_payment = np.repeat(np.cumsum(payment_counts) - payment_counts, payment_counts)
+        payment_rows = self.bootstrap(self.payments, len(payment_order))
+        shares = self.rng.random(len(payment_order))
+        shares /= np.bincount(payment_order, weights=shares, minlength=n)[payment_order]
+        totals = order_totals[payment_order]
+        payments = pd.DataFrame({
+            "order_id": order_ids[payment_order],
+            "payment_sequential": np.arange(len(payment_order)) - first_payment + 1,
+            "payment_type": payment_rows["payment_type"].to_numpy(),
+            "payment_installments": payment_rows["payment_installments"].to_numpy(),
+            "payment_value": np.where(totals > 0, totals * shares,
+                                      payment_rows["payment_value"].to_numpy()).round(2),
+        })
+
+        reviewed = self.rng.random(n) < self.review_rate
+        reviews = pd.DataFrame({
+            "review_id": make_ids(salts["review"], order_index[reviewed]),
+            "order_id": order_ids[reviewed],
+            "review_score": self.rng.choice(self.review_scores, int(reviewed.sum())),
+        })
+
+        return {
+            "olist_orders": orders,
+            "olist_order_items": items,
+            "olist_order_payments": payments,
+            "olist_order_reviews": reviews,
+        }
+
+    def generate(self, scale, write, chunk_size=500_000):
+        """Stream a dataset at `scale` times the real row counts to write(table, df)"""
+        salts = {name: binascii.hexlify(self.rng.bytes(8)).decode()
+                 for name in ("customer", "seller", "product", "order", "review")}
+        n_customers = max(1, round(scale * len(self.customers)))
+        n_sellers = max(1, round(scale * len(self.sellers)))
+        n_products = max(1, round(scale * len(self.products)))
+        n_orders = max(1, round(scale * len(self.orders)))
+        print(f"🔄 Scale {scale}x: {n_orders} orders, {n_customers} customers, "
+              f"{n_sellers} sellers, {n_products} products")
+
+        # Synthetic sellers/products inherit the popularity of the row they were cloned from
+        cdfs = {}
+        for table, source, columns, salt, n in (
+            ("olist_sellers", self.sellers, ["sellercity", "sellerstate"], salts["seller"], n_sellers),
+            ("olist_products", self.products, ["product_category_name"], salts["product"], n_products),
+        ):
+            weights = []
+            for start in range(0, n, chunk_size):
+                df, src = self.generate_dimension(table, source, columns, salt, start, min(chunk_size, n - start))
+                write(table, df)
+                weights.append(source["sales"].to_numpy()[src] + 1)
+            cdfs[table] = np.cumsum(np.concatenate(weights), dtype=float)
+
+        for start in range(0, n_customers, chunk_size):
+            df, _ = self.generate_dimension(
+                "olist_customers", self.customers, ["customer_city", "customer_state"],
+                salts["customer"], start, min(chunk_size, n_customers - start))
+            write("olist_customers", df)
+
+        for start in range(0, n_orders, chunk_size):
+            tables = self.generate_orders(start, min(chunk_size, n_orders - start), salts,
+                                          n_customers, cdfs["olist_products"], cdfs["olist_sellers"])
+            for table, df in tables.items():
+                write(table, df)
+            print(f"✅ {min(start + chunk_size, n_orders)}/{n_orders} orders written")
+
+    def csv_writer(self, out_dir):
+        """Return a write(table, df) that appends chunks to out_dir/<table>.csv"""
+        os.makedirs(out_dir, exist_ok=True)
+        started = set()
+
+        def write(table, df):
+            path = os.path.join(out_dir, f"{table}.csv")
+            df.to_csv(path, mode="a" if table in started else "w",
+                      header=table not in started, index=False)
+            started.add(table)
+        return write
+
+    def copy_writer(self, schema):
+        """Return a write(table, df) that COPYs chunks into empty copies of the tables in schema"""
+        self.cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        self.cursor.execute(f"CREATE SCHEMA {schema}")
+        for table in TABLE_COLUMNS:
+            self.cursor.execute(f"CREATE TABLE {schema}.{table} (LIKE public.{table} INCLUDING DEFAULTS)")
+
+        def write(table, df):
+            buffer = io.StringIO()
+            df.to_csv(buffer, header=False, index=False)
+            buffer.seek(0)
+            self.cursor.copy_expert(
+                f"COPY {schema}.{table} ({', '.join(TABLE_COLUMNS[table])}) FROM STDIN WITH CSV",
+                buffer,
+            )
+        return write
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Olist-shaped data at scale factors of the real tables")
+    parser.add_argument("--scale", type=float, nargs="+", default=[1, 10, 100],
+                        help="multiples of the real row counts to generate")
+    parser.add_argument("--out", default="scale_data",
+                        help="CSV output directory (one sf<scale>/ folder per scale)")
+    parser.add_argument("--copy", action="store_true",
+                        help="COPY into schema scale_<scale> instead of writing CSV files")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=500_000)
+    args = parser.parse_args()
+
+    generator = ScaledDataGenerator(seed=args.seed)
+    try:
+        for scale in args.scale:
+            label = f"{scale:g}".replace(".", "_")
+            if args.copy:
+                write = generator.copy_writer(f"scale_{label}")
+            else:
+                write = generator.csv_writer(os.path.join(args.out, f"sf{label}"))
+            generator.generate(scale, write, chunk_size=args.chunk_size)
+    finally:
+        generator.cursor.close()
+        generator.conn.close()
+
+
+if __name__ == "__main__":
+    main()
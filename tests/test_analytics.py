@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+
+import analytics
+
+
+class FakePyplot:
+    """Stands in for matplotlib.pyplot; savefig writes a placeholder file and records the chart title"""
+
+    def __init__(self):
+        self.saved = []
+        self.current_title = None
+
+    def title(self, text):
+        self.current_title = text
+
+    def savefig(self, path, format=None):
+        with open(path, "wb") as f:
+            f.write(b"png")
+        self.saved.append(self.current_title)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+@pytest.fixture
+def charts(tmp_path, monkeypatch):
+    """Run `analytics.py charts` against a fake database and pyplot; returns (titles saved, pyplot used)"""
+    monkeypatch.chdir(tmp_path)
+    data = {
+        "customer_state": ["SP", "RJ"], "payment_type": ["credit_card", "boleto"],
+        "total_orders": [10, 4], "total_customers": [8, 3],
+        "month": ["2018-01-01", "2018-02-01"], "monthly_orders": [6, 8],
+        "price": [99.9, 20.0], "freight_value": [10.0, 5.5],
+    }
+    monkeypatch.setattr(analytics, "run_query", lambda query, params=None: pd.DataFrame(data))
+    imports = []
+
+    def get_pyplot():
+        imports.append(True)
+        return plt
+
+    plt = FakePyplot()
+    monkeypatch.setattr(analytics, "get_pyplot", get_pyplot)
+
+    def run(*args):
+        plt.saved.clear()
+        imports.clear()
+        analytics.main(["charts", *args])
+        return list(plt.saved), bool(imports)
+
+    run.data = data
+    return run
+
+
+def test_unchanged_charts_are_not_redrawn(charts):
+    saved, _ = charts()
+    assert len(saved) == 6
+    assert charts() == ([], False)
+
+
+def test_changed_result_redraws_the_chart(charts):
+    charts()
+    charts.data["total_orders"] = [11, 4]
+    saved, imported = charts()
+    assert len(saved) == 6 and imported
+
+
+def test_changed_params_redraw_only_that_chart(charts):
+    charts()
+    saved, _ = charts("--start", "2018-01-01", "--end", "2018-07-01")
+    assert saved == ["Monthly Order Trends"]
+
+
+def test_force_redraws_unchanged_charts(charts):
+    charts()
+    saved, _ = charts("--force")
+    assert len(saved) == 6
@@ -0,0 +1,102 @@
+import os
+import asyncio
+from collections import namedtuple
+from decimal import Decimal
+
+import pytest
+
+import api
+
+Column = namedtuple("Column", ["name", "type_code"])
+
+NUMERIC, TEXT = 1700, 25
+
+
+def test_arrow_schema_comes_from_column_types_not_the_first_batch(monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    columns = (Column("order_id", TEXT), Column("price", NUMERIC))
+
+    def stream_query(sql, params=None, batch_size=10000, endpoint=None):
+        yield columns, [("a", None), ("b", None)]
+        yield columns, [("c", Decimal("9.90")), ("d", None)]
+
+    monkeypatch.setattr(api.db, "stream_query", stream_query)
+    table = pa.ipc.open_stream(b"".join(api.encoded_stream("SELECT", {}, "arrow"))).read_all()
+    assert table.schema.field("price").type == pa.float64()
+    assert table.column("price").to_pylist() == [None, None, 9.9, None]
+
+
+async def take(reader):
+    return await reader.__anext__()
+
+
+def test_late_reader_replays_a_retained_result():
+    async def scenario():
+        result = api.SharedResult()
+        await result.add(b"a")
+        late = result.read()
+        await result.add(b"b")
+        await result.finish()
+        return [chunk async for chunk in late]
+
+    assert asyncio.run(scenario()) == [b"a", b"b"]
+
+
+def test_producer_waits_for_the_slowest_reader(monkeypatch):
+    monkeypatch.setattr(api, "STREAM_BUFFER_BYTES", 15)
+
+    async def scenario():
+        result = api.SharedResult()
+        reader = result.read()
+        first = asyncio.ensure_future(take(reader))
+        await result.add(b"1" * 10)
+        assert await first == b"1" * 10
+        await result.add(b"2" * 10)
+        await result.add(b"3" * 10)
+        blocked = asyncio.ensure_future(result.add(b"4" * 10))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        assert await take(reader) == b"2" * 10
+        assert await asyncio.wait_for(blocked, 1) is True
+        await reader.aclose()
+
+    asyncio.run(scenario())
+
+
+def test_add_reports_when_nobody_can_read_an_oversized_result(monkeypatch):
+    monkeypatch.setattr(api, "CACHE_ENTRY_MAX_BYTES", 5)
+
+    async def scenario():
+        result = api.SharedResult()
+        reader = result.read()
+        first = asyncio.ensure_future(take(reader))
+        await asyncio.sleep(0)  # let the reader register before the result outgrows the cache limit
+        assert await result.add(b"x" * 10) is True
+        assert await first == b"x" * 10
+        assert not result.retained
+        assert await result.add(b"y") is True
+        assert result.chunks == [b"y"]
+        await reader.aclose()
+        return await result.add(b"z")
+
+    assert asyncio.run(scenario()) is False
+
+
+def test_cache_put_skips_oversized_results(monkeypatch):
+    monkeypatch.chdir(os.path.dirname(os.path.abspath(api.__file__)))
+    monkeypatch.setattr(api, "CACHE_ENTRY_MAX_BYTES", 5)
+
+    async def scenario():
+        service = api.ReportService()
+        small, large = api.SharedResult(), api.SharedResult()
+        await small.add(b"abc")
+        await large.add(b"x" * 10)
+        service.cache_put('"small"', small)
+        service.cache_put('"large"', large)
+        service.executor.shutdown()
+        return service
+
+    service = asyncio.run(scenario())
+    assert service.cache_get('"small"') is not None
+    assert service.cache_get('"large"') is None
+    assert service.cache_bytes == 3
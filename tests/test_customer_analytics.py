@@ -0,0 +1,60 @@
+import pandas as pd
+
+import customer_analytics as ca
+
+
+def orders_frame(rows):
+    return pd.DataFrame({
+        "order_id": [f"o{i}" for i in range(len(rows))],
+        "customer_unique_id": [customer for customer, _ in rows],
+        "purchased_at": pd.to_datetime([day for _, day in rows]),
+        "value": 10.0,
+        "customer_state": "SP",
+    })
+
+
+def test_segments_take_the_first_matching_rule():
+    rows = [("champion", f"2018-06-{day:02d}") for day in range(1, 7)]  # r 5, f 5
+    rows += [("new", "2018-05-20")]                                      # r 4, f 1
+    rows += [("loyal", day) for day in ["2018-01-01", "2018-02-01", "2018-04-01"]]  # r 3, f 3
+    rows += [("hibernating", "2018-03-01")]                              # r 2, f 1
+    rows += [("at_risk", day) for day in ["2017-01-01", "2017-02-01", "2017-03-01"]]  # r 1, f 3
+    rfm = ca.rfm_segments(orders_frame(rows)).set_index("customer_unique_id")
+    assert rfm["segment"].to_dict() == {
+        "at_risk": "At Risk",
+        "champion": "Champions",
+        "hibernating": "Hibernating",
+        "loyal": "Loyal",
+        "new": "New",
+    }
+
+
+def test_retention_leaves_months_after_the_data_empty():
+    retention = ca.retention_cohorts(orders_frame([
+        ("a", "2018-01-05"), ("a", "2018-02-01"), ("b", "2018-01-09"),
+        ("b", "2018-03-01"), ("c", "2018-02-10"),
+    ])).set_index("cohort")
+    assert retention.loc["2018-01", "month_1"] == 0.5
+    assert retention.loc["2018-02", "month_1"] == 0.0
+    assert pd.isna(retention.loc["2018-02", "month_2"])
+
+
+def test_delivery_is_late_by_calendar_day():
+    tables = {
+        "customers": pd.DataFrame({"customer_id": ["c1", "c2"], "customer_state": ["SP", "RJ"]}),
+        "orders": pd.DataFrame({
+            "order_id": ["same_day", "two_days", "canceled"],
+            "customer_id": ["c1", "c2", "c1"],
+            "order_status": ["delivered", "delivered", "canceled"],
+            "order_purchase_timestamp": pd.to_datetime(["2018-01-01", "2018-01-01", "2018-01-01"]),
+            "order_delivered_customer_date": pd.to_datetime(["2018-01-10 23:00", "2018-01-12 01:00", None]),
+            "order_estimated_delivery_date": pd.to_datetime(["2018-01-10", "2018-01-10", "2018-01-10"]),
+        }),
+    }
+    sla = ca.delivery_sla(tables).set_index("order_id")
+    assert sla["late"].to_dict() == {"same_day": False, "two_days": True}
+    assert sla["days_late"].to_dict() == {"same_day": 0, "two_days": 2}
+
+    by_state = ca.sla_breaches(sla.reset_index(), "customer_state").set_index("customer_state")
+    assert by_state.loc["RJ", "late_rate"] == 1.0
+    assert by_state.loc["SP", "late_orders"] == 0
@@ -0,0 +1,31 @@
+import os
+import sys
+import json
+import time
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["pandas", "matplotlib", "seaborn", "plotly", "openpyxl", "psycopg2"]
+
+CHECK = f"""
+import json, sys
+import analytics, main
+print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))
+"""
+
+
+def import_entry_points():
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHECK], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1]), time.perf_counter() - started
+
+
+def test_importing_entry_points_skips_heavy_modules():
+    loaded, _ = import_entry_points()
+    assert loaded == []
+
+
+def test_importing_entry_points_is_fast():
+    _, elapsed = import_entry_points()
+    assert elapsed < 2.0, f"importing analytics and main took {elapsed:.2f}s"
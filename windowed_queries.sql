@@ -0,0 +1,53 @@
+-- Date-windowed variants of the time-based reports in queries.sql (2, 5, 7, 18).
+-- Each one bounds o.order_purchase_timestamp with %(start)s (inclusive) and %(end)s (exclusive),
+-- so on a partitioned olist_orders Postgres only scans the months in the window.
+-- Run with: python main.py --start 2018-01-01 --end 2018-07-01
+
+-- 2. Delivered orders after 2018-01-01 with payment info (INNER JOIN)
+SELECT o.order_id, o.order_delivered_customer_date, 
+       p.payment_type, p.payment_value,
+       r.review_score
+FROM olist_orders o
+INNER JOIN olist_order_payments p ON o.order_id = p.order_id
+LEFT JOIN olist_order_reviews r ON o.order_id = r.order_id
+WHERE o.order_status = 'delivered' 
+  AND o.order_delivered_customer_date > '2018-01-01'
+  AND o.order_purchase_timestamp >= %(start)s
+  AND o.order_purchase_timestamp < %(end)s
+ORDER BY o.order_delivered_customer_date ASC;
+
+-- 5. First and last order per year (GROUP BY + MIN/MAX)
+SELECT DATE_PART('year', order_purchase_timestamp) AS year,
+       MIN(order_purchase_timestamp) AS first_order,
+       MAX(order_purchase_timestamp) AS last_order
+FROM olist_orders
+WHERE order_purchase_timestamp >= %(start)s
+  AND order_purchase_timestamp < %(end)s
+GROUP BY year
+ORDER BY year;
+
+-- 7. Total orders per year (GROUP BY + COUNT)
+SELECT DATE_PART('year', o.order_purchase_timestamp) AS year,
+       COUNT(DISTINCT o.order_id) AS total_orders,
+       SUM(oi.price) AS total_revenue,
+       ROUND(AVG(p.payment_value), 2) AS avg_payment
+FROM olist_orders o
+JOIN olist_order_items oi ON o.order_id = oi.order_id
+JOIN olist_order_payments p ON o.order_id = p.order_id
+WHERE o.order_purchase_timestamp >= %(start)s
+  AND o.order_purchase_timestamp < %(end)s
+GROUP BY year
+ORDER BY year;
+
+-- 18. Monthly sales trend (time series)
+SELECT DATE_TRUNC('month', o.order_purchase_timestamp) AS month,
+       SUM(oi.price) AS total_sales,
+       ROUND(AVG(r.review_score), 2) AS avg_review
+FROM olist_orders o
+JOIN olist_order_items oi ON o.order_id = oi.order_id
+LEFT JOIN olist_order_reviews r ON o.order_id = r.order_id
+WHERE o.order_status = 'delivered'
+  AND o.order_purchase_timestamp >= %(start)s
+  AND o.order_purchase_timestamp < %(end)s
+GROUP BY month
+ORDER BY month;